@@ -16,7 +16,7 @@ def preprocess_twitter_accounts(economists_info_path, repec_userinfo_path, outpu
     try:
         # Load the CSV files
         economists_info = pd.read_csv(economists_info_path)
-        repec_userinfo = pd.read_csv(repec_userinfo_path, dtype={'id': 'str'})
+        repec_userinfo = pd.read_csv(repec_userinfo_path, dtype={'id': 'string[pyarrow]'})
       
         # Preprocess the Twitter Account to match the username format
         economists_info['Modified Twitter Account'] = economists_info['Twitter Account'].str.replace('@', '').str.replace(' ', '', regex=False).str.lower()
@@ -42,34 +42,37 @@ def preprocess_twitter_accounts(economists_info_path, repec_userinfo_path, outpu
         print(f"An unexpected error occurred: {e}")
 
 
-def update_tweets_with_repec_id(cleaned_tweets_path, updated_userinfo_path, output_tweets_path):
+def update_tweets_with_repec_id(cleaned_tweets_path, updated_userinfo_path, output_tweets_path, output_tweets_parquet_path):
     """
     Fill missing 'RePEc_id' values in the tweets dataset using 'RePEc_id' from the updated userinfo dataset.
+    The result is saved as csv for the notebooks and as Parquet for filter_tweets.py.
     """
     try:
         # Load the datasets
         updated_userinfo = pd.read_csv(updated_userinfo_path, dtype={
-                                       'id': 'str', 'RePEc_id': 'str'})
-        cleaned_tweets = pd.read_csv(cleaned_tweets_path, dtype={
-                                     'author_id': 'str', 'RePEc_id': 'str'}, low_memory=False)
+                                       'id': 'string[pyarrow]', 'RePEc_id': 'string[pyarrow]'})
+        cleaned_tweets = pd.read_parquet(cleaned_tweets_path, engine='pyarrow')
 
         # Find non-unique 'id' values in the updated userinfo dataset
-        duplicate_ids = updated_userinfo[updated_userinfo.duplicated('id', keep=False)]['id'].unique()
-        if len(duplicate_ids) > 0:
+        duplicated_mask = updated_userinfo['id'].duplicated()
+        if duplicated_mask.any():
+            duplicate_ids = updated_userinfo.loc[duplicated_mask, 'id'].unique().tolist()
             print(f"The 'id' column in the updated userinfo dataset is not unique. Non-unique ids: {duplicate_ids}")
             return  # Stop execution if there are non-unique IDs
 
         # Identify rows with missing 'RePEc_id' and fill them
         missing_repec_ids = cleaned_tweets['RePEc_id'].isnull()
         id_map = updated_userinfo.drop_duplicates(
-            'id').set_index('id')['RePEc_id']
+            'id').set_index('id')['RePEc_id'].to_dict()
         cleaned_tweets.loc[missing_repec_ids, 'RePEc_id'] = cleaned_tweets.loc[missing_repec_ids, 'author_id']\
             .map(id_map)
 
         # Save the updated tweets dataset
         cleaned_tweets.to_csv(output_tweets_path, index=False)
+        cleaned_tweets.to_parquet(output_tweets_parquet_path, compression='zstd', engine='pyarrow',
+                                  index=False, row_group_size=1_000_000)
         print(
-            f"Updated tweets have been successfully saved to {output_tweets_path}")
+            f"Updated tweets have been successfully saved to {output_tweets_path} and {output_tweets_parquet_path}")
     except FileNotFoundError:
         print("One of the input files was not found. Please check the file paths.")
     except ValueError as ve:
@@ -81,11 +84,12 @@ def update_tweets_with_repec_id(cleaned_tweets_path, updated_userinfo_path, outp
 if __name__ == "__main__":
     economists_info_path = '../data/csv/Economists_Info.csv'
     repec_userinfo_path = '../data/csv/RePEc_userinfo.csv'
-    cleaned_tweets_path = '../data/csv/cleaned_RePEc_tweets.csv'
+    cleaned_tweets_path = '../data/parquet/cleaned_RePEc_tweets.parquet'
     output_userinfo_path = '../data/csv/cleaned_RePEc_userinfo.csv'
     output_tweets_path = '../data/csv/cleaned_RePEc_tweets.csv'
+    output_tweets_parquet_path = '../data/parquet/updated_RePEc_tweets.parquet'
 
     preprocess_twitter_accounts(
         economists_info_path, repec_userinfo_path, output_userinfo_path)
     update_tweets_with_repec_id(
-        cleaned_tweets_path, output_userinfo_path, output_tweets_path)
+        cleaned_tweets_path, output_userinfo_path, output_tweets_path, output_tweets_parquet_path)
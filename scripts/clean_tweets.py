@@ -5,56 +5,103 @@ Date: 2024-02-22
 Description: 
 
 Reads in RePEc_tweets.csv and cleans the data row by row, fixing the structure of the csv file that was misformatted due to the 'text' field. 
-Returns the cleaned file as cleaned_RePEc_tweets.csv.
+Returns the cleaned data as the Parquet dataset cleaned_RePEc_tweets.parquet.
 """
 import pandas as pd
 import csv
-from io import StringIO
-
-
-def is_row_complete(row, num_columns):
-    try:
-        parsed_row = next(csv.reader([row]))  # Handles commas within quotes
-        return len(parsed_row) == num_columns
-    except Exception as e:
-        print(f"Error parsing row: {e}")
-        return False
-
-
-def clean_and_process_csv(file_path, final_cleaned_file_path):
-    cleaned_data = StringIO()
-    writer = csv.writer(cleaned_data)
-
-    with open(file_path, 'r', encoding='utf-8') as infile:
-        reader = infile.readlines()
-
-        num_columns = len(reader[0].strip().split(','))
-        writer.writerow(reader[0].strip().split(','))  # Writes the header
-
-        accumulated_line = ''
-        for line in reader[1:]:
-            concatenated_line = ' '.join(
-                [accumulated_line, line.strip()]).strip()
-            if is_row_complete(concatenated_line, num_columns):
-                writer.writerow(next(csv.reader([concatenated_line])))
-                accumulated_line = ''
-            else:
-                accumulated_line = concatenated_line
-
-    cleaned_data.seek(0)  # Reset StringIO cursor to the beginning
-
-    # Loads the cleaned CSV data from StringIO into the DataFrame
-    data = pd.read_csv(cleaned_data,
-                       dtype={'referenced_id': str,
-                              'id': str,
-                              'author_id': str,
-                              'RePEc_id': str,
-                              'created_at': str,
-                              'text': str,
-                              'referenced_type': str,
-                              'referenced_id': str,
-                              'lang': str})
-
+import os
+import re
+import shutil
+import tempfile
+
+try:
+    import dask.dataframe as dd
+except ImportError:
+    dd = None
+
+
+# Parser states mirroring the csv module's default dialect
+START_FIELD, IN_FIELD, IN_QUOTED_FIELD, QUOTE_IN_QUOTED_FIELD = range(4)
+
+
+SPECIAL_CHARS = re.compile(r'[",]')
+
+# Name of the part files making up the cleaned Parquet dataset
+PART_FILE = re.compile(r'part\.\d+\.parquet')
+
+
+def scan_row_chunk(chunk, state, field_count):
+    """
+    Advance the quote state and field count of a partially read row over a newly appended chunk.
+    Only the quotes and commas are visited; any other characters in between move a field forward.
+    """
+    pos, length = 0, len(chunk)
+    while pos < length:
+        if state == IN_QUOTED_FIELD:
+            # Inside quotes only the next '"' matters, commas are part of the field
+            pos = chunk.find('"', pos) + 1
+            if pos == 0:
+                break
+            state = QUOTE_IN_QUOTED_FIELD
+            continue
+
+        match = SPECIAL_CHARS.search(chunk, pos)
+        end = match.start() if match else length
+        if end > pos and state in (START_FIELD, QUOTE_IN_QUOTED_FIELD):
+            state = IN_FIELD
+        if match is None:
+            break
+        pos = match.end()
+
+        if match.group() == ',':
+            state = START_FIELD
+            field_count += 1
+        elif state in (START_FIELD, QUOTE_IN_QUOTED_FIELD):
+            state = IN_QUOTED_FIELD  # Opening quote, or an escaped double quote
+    return state, field_count
+
+
+def repair_rows(infile, writer):
+    """
+    Write the rows of a misformatted csv file, rejoining records whose 'text' field was split across lines.
+    """
+    header = next(infile).strip().split(',')
+    num_columns = len(header)
+    writer.writerow(header)  # Writes the header
+
+    accumulated_line = ''
+    state, field_count = START_FIELD, 1
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+
+        # Fast path for a row that is complete on its own line, parsed once at C speed. Strict
+        # parsing rejects a line that ends inside an open quote, which then goes to the scan below
+        if not accumulated_line:
+            try:
+                row = next(csv.reader([line], strict=True))
+            except csv.Error:
+                row = None
+            if row is not None and len(row) == num_columns:
+                writer.writerow(row)
+                continue
+
+        chunk = ' ' + line if accumulated_line else line
+        accumulated_line += chunk
+
+        # Only the new chunk is scanned, the row is parsed once when complete
+        state, field_count = scan_row_chunk(chunk, state, field_count)
+        if state != IN_QUOTED_FIELD and field_count == num_columns:
+            writer.writerow(next(csv.reader([accumulated_line])))
+            accumulated_line = ''
+            state, field_count = START_FIELD, 1
+
+
+def process_chunk(data):
+    """
+    Coerce the column types of a chunk of cleaned rows and drop the rows that remain malformed.
+    """
     # Ensures that the numeric columns are of the correct type
     numeric_columns = ['retweet_count', 'reply_count',
                        'like_count', 'quote_count', 'impression_count']
@@ -64,21 +111,98 @@ def clean_and_process_csv(file_path, final_cleaned_file_path):
 
     data['referenced_id'] = data['referenced_id'].fillna('NA')
     data['referenced_type'] = data['referenced_type'].fillna('own')
-    data['created_at'] = pd.to_datetime(data['created_at'], errors='coerce')
-    data['created_at'] = data['created_at'].dt.tz_localize(
-        None).dt.tz_localize('UTC')
+    data['created_at'] = pd.to_datetime(data['created_at'], format='ISO8601', errors='coerce', utc=True)
+    data['created_at'] = data['created_at'].dt.as_unit('us')  # Same Parquet schema in every part file
     data = data.dropna(subset=numeric_columns + ['created_at'])
 
     # Updates impression_count to NA for tweets with created_at year > 2022 and impression_count = 0
-    condition = (data['created_at'].dt.year < 2023) & (
-        data['impression_count'] == 0)
-    data.loc[condition, 'impression_count'] = pd.NA
-
-    data.to_csv(final_cleaned_file_path, index=False)
+    # The mask is computed on the raw numpy buffers, which hold no NA after the dropna above
+    years = data['created_at'].values.astype('datetime64[Y]').astype(int) + 1970
+    impression_count = data['impression_count'].to_numpy(dtype='int64')
+    condition = (years < 2023) & (impression_count == 0)
+    data['impression_count'] = pd.arrays.IntegerArray(impression_count, condition)
+    return data
+
+
+def is_replaceable_output(path):
+    """
+    Return True if 'path' is absent, a single file, or a dataset directory holding only Parquet part files.
+    """
+    if not os.path.isdir(path):
+        return True
+    return all(PART_FILE.fullmatch(name) for name in os.listdir(path))
+
+
+def clean_and_process_csv(file_path, final_cleaned_parquet_path, chunksize=500_000, staging_dir=None):
+    # Refuse up front to replace a directory that holds anything besides a previous run's part files
+    if not is_replaceable_output(final_cleaned_parquet_path):
+        raise ValueError(f"{final_cleaned_parquet_path} is a directory with files other than Parquet part files, "
+                         "refusing to overwrite it.")
+
+    # Cleaned rows are staged on disk so pandas can parse them without holding a second copy in memory.
+    # The staged copy is as large as the input, so it goes next to the output rather than into the
+    # system temp directory, which may be a small or memory-backed filesystem
+    if staging_dir is None:
+        staging_dir = os.path.dirname(os.path.abspath(final_cleaned_parquet_path))
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', newline='', suffix='.csv', delete=False, dir=staging_dir)
+    dataset_dir = None
+    try:
+        with tmp, open(file_path, 'r', encoding='utf-8') as infile:
+            repair_rows(infile, csv.writer(tmp))
+
+        # Complete dtype map for the tweets columns, in file order, so no column is left to inference.
+        # Counts are read as text and coerced by process_chunk, so one malformed value drops its row
+        # instead of breaking the type inference of a whole Dask partition
+        dtype = {'id': 'string[pyarrow]',
+                 'author_id': 'string[pyarrow]',
+                 'RePEc_id': 'string[pyarrow]',
+                 'created_at': 'string[pyarrow]',
+                 'text': 'string[pyarrow]',
+                 'referenced_type': 'string[pyarrow]',
+                 'referenced_id': 'string[pyarrow]',
+                 'lang': 'string[pyarrow]',
+                 'retweet_count': 'string[pyarrow]',
+                 'reply_count': 'string[pyarrow]',
+                 'like_count': 'string[pyarrow]',
+                 'quote_count': 'string[pyarrow]',
+                 'impression_count': 'string[pyarrow]'}
+
+        # The output is a directory of zstd-compressed Parquet part files. It is written to a fresh
+        # directory beside the output and only swapped in once complete
+        output_dir = os.path.dirname(os.path.abspath(final_cleaned_parquet_path))
+        os.makedirs(output_dir, exist_ok=True)
+        dataset_dir = tempfile.mkdtemp(suffix='.parquet', dir=output_dir)
+
+        if dd is not None:
+            # Cleaned rows never span lines, so Dask can split the file by byte range and process partitions in parallel
+            data = dd.read_csv(tmp.name, dtype=dtype, blocksize='256MB')
+            data.map_partitions(process_chunk).to_parquet(
+                dataset_dir, compression='zstd', engine='pyarrow', write_index=False,
+                name_function=lambda i: f'part.{i:05d}.parquet')
+        else:
+            # Loads the cleaned CSV data in chunks and writes each processed chunk as its own part file
+            chunks = pd.read_csv(tmp.name, dtype=dtype, engine='c', chunksize=chunksize)
+            for i, data in enumerate(chunks):
+                data = process_chunk(data)
+                data.to_parquet(os.path.join(dataset_dir, f'part.{i:05d}.parquet'),
+                                compression='zstd', engine='pyarrow', index=False)
+
+        # Replace the previous output, a dataset of part files or a single Parquet file
+        if os.path.isdir(final_cleaned_parquet_path):
+            shutil.rmtree(final_cleaned_parquet_path)
+        elif os.path.exists(final_cleaned_parquet_path):
+            os.remove(final_cleaned_parquet_path)
+        os.rename(dataset_dir, final_cleaned_parquet_path)
+    finally:
+        os.remove(tmp.name)
+        if dataset_dir is not None and os.path.isdir(dataset_dir):
+            shutil.rmtree(dataset_dir)
 
 
 if __name__ == "__main__":
     file_path = '../data/csv/RePEc_tweets.csv'
-    final_cleaned_file_path = '../data/csv/cleaned_RePEc_tweets.csv'
-    clean_and_process_csv(file_path, final_cleaned_file_path)
+    final_cleaned_parquet_path = '../data/parquet/cleaned_RePEc_tweets.parquet'
+    clean_and_process_csv(file_path, final_cleaned_parquet_path)
     print("CSV file has been cleaned and processed.")
@@ -6,44 +6,98 @@ Description:
 
 Outputs tweets about 'Mastodon' and 'Elon' from 2022 onward to separate csv files.
 """
+import re
+from datetime import datetime
+
 import pandas as pd
+import pyarrow.parquet as pq
 
-def filter_and_save_tweets(input_file_path, output_mastadon_path, output_elon_path, userinfo_file_path):
-    try:
-        # Read in the tweets and userinfo data
-        tweets_df = pd.read_csv(input_file_path, dtype={'RePEc_id': 'object', 'referenced_id': 'str', 'author_id': 'str', 'id': 'str'}, parse_dates=['created_at'], low_memory=False)
-        userinfo_df = pd.read_csv(userinfo_file_path, dtype={'RePEc_id': 'object', 'id': 'str'})
+try:
+    import dask.dataframe as dd
+except ImportError:
+    dd = None
 
-        if 'text' not in tweets_df.columns:
-            raise ValueError("The 'text' column was not found in the input file. Please check the file structure.")
+try:
+    import polars as pl
+except ImportError:
+    pl = None
 
-        # Merge tweets_df with userinfo_df to populate RePEc_id based on author_id
-        tweets_df = tweets_df.merge(userinfo_df[['id', 'RePEc_id']], left_on='author_id', right_on='id', how='left', suffixes=('', '_userinfo'))
-        
-        # Drop rows where RePEc_id is NaN after merging
-        tweets_df = tweets_df.dropna(subset=['RePEc_id_userinfo'])
 
-        # Replace the original RePEc_id with the one populated from userinfo, if available
-        tweets_df['RePEc_id'] = tweets_df['RePEc_id_userinfo']
-        tweets_df = tweets_df.drop(columns=['id_userinfo', 'RePEc_id_userinfo'])
+def keyword_mask(text, keywords):
+    """
+    Return a boolean mask of the rows in 'text' that contain any of the keywords, ignoring case.
+    A single compiled alternation is matched natively over the Arrow-backed strings.
+    Null texts are expected to be dropped beforehand.
+    """
+    pattern = re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE)
+    return text.str.contains(pattern, na=False)
 
-        # Convert 'created_at' to timezone-naive UTC before filtering
-        tweets_df['created_at'] = tweets_df['created_at'].dt.tz_localize(None)
+def flag_and_merge_chunk(tweets_df, userinfo_df, mastadon_keywords, elon_keywords):
+    """
+    Keep the tweets of a chunk posted after January 1, 2022 that match either keyword set,
+    flag which set they match and populate their RePEc_id from userinfo.
+    """
+    if 'text' not in tweets_df.columns:
+        raise ValueError("The 'text' column was not found in the input file. Please check the file structure.")
 
-        # Filter tweets by date, keeping only those after January 1, 2022
-        tweets_df = tweets_df[tweets_df['created_at'] > pd.Timestamp('2022-01-01')]
+    # Convert 'created_at' to timezone-naive UTC before filtering
+    tweets_df['created_at'] = tweets_df['created_at'].dt.tz_localize(None)
 
-        # Sort the entire dataset by 'created_at'
-        tweets_df = tweets_df.sort_values(by='created_at')
+    # Filter tweets by date, keeping only those after January 1, 2022, before any merging
+    tweets_df = tweets_df[tweets_df['created_at'] > pd.Timestamp('2022-01-01')]
+
+    # Drop tweets without text up front so the keyword scans only ever see strings
+    tweets_df = tweets_df.dropna(subset=['text'])
+
+    # Flag case-insensitive matches for 'mastodon' related keywords and for 'elon' and 'musk'
+    tweets_df = tweets_df.assign(is_mastadon=keyword_mask(tweets_df['text'], mastadon_keywords),
+                                 is_elon=keyword_mask(tweets_df['text'], elon_keywords))
+
+    # Only tweets matching either keyword set need a RePEc_id lookup
+    tweets_df = tweets_df[tweets_df['is_mastadon'] | tweets_df['is_elon']]
+
+    # Only users with a RePEc_id can match, keyed on 'author_id' so the merge adds no duplicate key column
+    userinfo_df = userinfo_df[['id', 'RePEc_id']].dropna(subset=['RePEc_id'])\
+        .rename(columns={'id': 'author_id', 'RePEc_id': 'RePEc_id_new'})
+
+    # Share one categorical dtype between the join keys so the merge runs on integer codes
+    all_ids = pd.Index(userinfo_df['author_id'].dropna().unique()).union(tweets_df['author_id'].dropna().unique())
+    id_dtype = pd.CategoricalDtype(all_ids)
+    tweets_df = tweets_df.assign(author_id=tweets_df['author_id'].astype(id_dtype))
+    userinfo_df = userinfo_df.assign(author_id=userinfo_df['author_id'].astype(id_dtype))
 
-        # Filter for case-insensitive search for 'mastodon' related keywords
+    # Inner merge populates RePEc_id from userinfo and drops tweets whose author has none
+    tweets_df = tweets_df.merge(userinfo_df, on='author_id', how='inner')
+    tweets_df['RePEc_id'] = tweets_df['RePEc_id_new']
+    return tweets_df.drop(columns=['RePEc_id_new'])
+
+def filter_and_save_tweets(input_file_path, output_mastadon_path, output_elon_path, userinfo_file_path, chunksize=1_000_000):
+    try:
+        # Read in the userinfo data once and the Parquet tweets in row batches
+        userinfo_df = pd.read_csv(userinfo_file_path, dtype={'RePEc_id': 'string[pyarrow]', 'id': 'string[pyarrow]'})
+
+        # Only the matching tweets, a small fraction of each chunk, are kept in memory
         mastadon_keywords = ['mastodon', 'mastadon', 'mastadan']
-        mastadon_tweets_df = tweets_df[tweets_df['text'].apply(lambda x: isinstance(x, str) and any(keyword.lower() in x.lower() for keyword in mastadon_keywords))]
+        elon_keywords = ['musk', 'elon']
+        if dd is not None:
+            # Partitions are filtered in parallel, each merging against the same small userinfo frame
+            tweets_ddf = dd.read_parquet(input_file_path, engine='pyarrow')
+            tweets_df = tweets_ddf.map_partitions(flag_and_merge_chunk, userinfo_df, mastadon_keywords, elon_keywords).compute()
+        else:
+            parquet_file = pq.ParquetFile(input_file_path)
+            # The empty schema table is run through the same filter first, so a file without any row
+            # batches still yields an empty frame with the expected columns and writes empty outputs
+            tables = [parquet_file.schema_arrow.empty_table(), *parquet_file.iter_batches(batch_size=chunksize)]
+            tweets_df = pd.concat([flag_and_merge_chunk(table.to_pandas(), userinfo_df, mastadon_keywords, elon_keywords) for table in tables])
+
+        # Sort the matching tweets by 'created_at'
+        tweets_df = tweets_df.sort_values(by='created_at')
+
+        # Split the flagged tweets into the two outputs
+        mastadon_tweets_df = tweets_df[tweets_df['is_mastadon']].drop(columns=['is_mastadon', 'is_elon'])
         mastadon_tweets_df.to_csv(output_mastadon_path, index=False)
 
-        # Filter for case-insensitive search for 'elon' and 'musk'
-        elon_keywords = ['musk', 'elon']
-        elon_tweets_df = tweets_df[tweets_df['text'].apply(lambda x: isinstance(x, str) and any(keyword.lower() in x.lower() for keyword in elon_keywords))]
+        elon_tweets_df = tweets_df[tweets_df['is_elon']].drop(columns=['is_mastadon', 'is_elon'])
         elon_tweets_df.to_csv(output_elon_path, index=False)
 
         print(f"Filtered data has been successfully saved to {output_mastadon_path} and {output_elon_path}")
@@ -52,11 +106,54 @@ def filter_and_save_tweets(input_file_path, output_mastadon_path, output_elon_pa
     except Exception as e:
         print(f"An error occurred: {e}")
 
+def filter_and_save_tweets_lazy(input_file_path, output_mastadon_path, output_elon_path, userinfo_file_path):
+    """
+    Polars lazy equivalent of filter_and_save_tweets. The date and keyword filters are planned
+    ahead of the userinfo join, and the tweets file is scanned rather than loaded up front.
+    """
+    try:
+        mastadon_keywords = ['mastodon', 'mastadon', 'mastadan']
+        elon_keywords = ['musk', 'elon']
+        mastadon_pattern = '(?i)' + '|'.join(map(re.escape, mastadon_keywords))
+        elon_pattern = '(?i)' + '|'.join(map(re.escape, elon_keywords))
+
+        # Only users with a RePEc_id can survive the join
+        userinfo_lf = pl.scan_csv(userinfo_file_path, schema_overrides={'RePEc_id': pl.Utf8, 'id': pl.Utf8})\
+            .select(pl.col('id').alias('author_id'), pl.col('RePEc_id').alias('RePEc_id_userinfo'))\
+            .drop_nulls('RePEc_id_userinfo')
+
+        tweets_df = pl.scan_parquet(input_file_path)\
+            .with_columns(pl.col('created_at').dt.replace_time_zone(None))\
+            .filter(pl.col('created_at') > datetime(2022, 1, 1), pl.col('text').is_not_null())\
+            .with_columns(is_mastadon=pl.col('text').str.contains(mastadon_pattern),
+                          is_elon=pl.col('text').str.contains(elon_pattern))\
+            .filter(pl.col('is_mastadon') | pl.col('is_elon'))\
+            .join(userinfo_lf, on='author_id', how='inner')\
+            .with_columns(pl.col('RePEc_id_userinfo').alias('RePEc_id'))\
+            .drop('RePEc_id_userinfo')\
+            .sort('created_at')\
+            .collect()
+
+        # The matching tweets are few, so both outputs are written from the collected frame
+        tweets_df.filter(pl.col('is_mastadon')).drop('is_mastadon', 'is_elon')\
+            .write_csv(output_mastadon_path, datetime_format='%Y-%m-%d %H:%M:%S')
+        tweets_df.filter(pl.col('is_elon')).drop('is_mastadon', 'is_elon')\
+            .write_csv(output_elon_path, datetime_format='%Y-%m-%d %H:%M:%S')
+
+        print(f"Filtered data has been successfully saved to {output_mastadon_path} and {output_elon_path}")
+    except FileNotFoundError:
+        print(f"File {input_file_path} or {userinfo_file_path} not found. Please check the file paths.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
 # Define file paths
-input_file_path = '../data/csv/cleaned_RePEc_tweets.csv'
+input_file_path = '../data/parquet/updated_RePEc_tweets.parquet'
 userinfo_file_path = '../data/csv/cleaned_RePEc_userinfo.csv'
 output_mastadon_path = '../data/csv/mastadon_tweets.csv'
 output_elon_path = '../data/csv/elon_tweets.csv'
 
 if __name__ == "__main__":
-    filter_and_save_tweets(input_file_path, output_mastadon_path, output_elon_path, userinfo_file_path)
+    if pl is not None:
+        filter_and_save_tweets_lazy(input_file_path, output_mastadon_path, output_elon_path, userinfo_file_path)
+    else:
+        filter_and_save_tweets(input_file_path, output_mastadon_path, output_elon_path, userinfo_file_path)
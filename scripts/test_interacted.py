@@ -6,6 +6,8 @@ Description:
 
 Test script for interaction algorithm.
 """
+import ast
+
 import pandas as pd
 
 def initialize_mentions_interacted_df(userinfo_df, max_week):
@@ -19,63 +21,71 @@ def initialize_mentions_interacted_df(userinfo_df, max_week):
         df[week_col] = 0
     return df
 
-def create_following_dict(repec_following_df):
+def parse_repec_users(mastodon_user_week_df):
     """
-    Create a dictionary mapping repec_id to a list of their follower_repec_ids.
+    Parse the stringified 'repec_users' lists into Python lists once, ahead of the update passes.
     """
-    return repec_following_df.groupby('repec_id')['follower_repec_id'].apply(list).to_dict()
+    return mastodon_user_week_df.assign(repec_users=mastodon_user_week_df['repec_users'].map(ast.literal_eval))
 
 def update_mentions_df(mentions_df, mastodon_user_week_df):
     """
     Update the mentions DataFrame based on mastodon_user_week data.
     """
-    for _, row in mastodon_user_week_df.iterrows():
-        week_num = row['week']
-        repec_users = row['repec_users'][1:-1].replace("'", "").split(", ")
-        print(f"Processing mentions for week {week_num}: {repec_users}")
-
-        for repec_id in repec_users:
-            if repec_id in mentions_df['repec_id'].values:
-                mentions_df.loc[mentions_df['repec_id'] == repec_id, f'week{week_num}'] = 1
-                print(f"Marked {repec_id} as mentioned in week {week_num}")
+    # Explode the weekly user lists into one (repec_id, week) row per mention
+    long_df = mastodon_user_week_df.explode('repec_users', ignore_index=True)
+
+    # Pivot to a 0/1 user x week matrix and map it onto the rows of mentions_df in one pass,
+    # positionally, since 'repec_id' repeats (e.g. the null ids of unmatched users)
+    wide = pd.crosstab(long_df['repec_users'], long_df['week']).clip(upper=1)
+    wide.columns = [f'week{week_num}' for week_num in wide.columns]
+
+    mentions_df[list(wide.columns)] = wide.reindex(mentions_df['repec_id']).fillna(0).astype(int).to_numpy()
     return mentions_df
 
-def update_interacted_df(interacted_df, mastodon_user_week_df, following_dict):
+def update_interacted_df(interacted_df, mastodon_user_week_df, rows_of, week_cols):
     """
-    Update the interacted DataFrame based on mastodon_user_week and repec_following data.
+    Update the interacted DataFrame based on mastodon_user_week data.
+    'rows_of' maps each repec_id to its row positions and 'week_cols' lists the week columns in order.
     """
-    for _, row in mastodon_user_week_df.iterrows():
-        week_num = row['week']
-        repec_users = row['repec_users'][1:-1].replace("'", "").split(", ")
-        print(f"Processing interactions for week {week_num}: {repec_users}")
-
-        for repec_id in repec_users:
-            if repec_id in interacted_df['repec_id'].values:
-                interacted_df.loc[interacted_df['repec_id'] == repec_id, f'week{week_num}'] = 1
-                print(f"Marked {repec_id} as interacted in week {week_num}")
-
-            if repec_id in following_dict:
-                followers = following_dict[repec_id]
-                for follower_id in followers:
-                    if follower_id in repec_users:
-                        interacted_df.loc[interacted_df['repec_id'] == repec_id, f'week{week_num}'] = 1
-                        print(f"Marked {repec_id} as interacted in week {week_num} due to follower {follower_id}")
+    marks = interacted_df[week_cols].to_numpy(copy=True)
+    position_of = {week_col: j for j, week_col in enumerate(week_cols)}
+
+    for week_num, repec_users in zip(mastodon_user_week_df['week'], mastodon_user_week_df['repec_users']):
+        if f'week{week_num}' not in position_of:
+            raise ValueError(f"Week {week_num} has no column in the interacted DataFrame.")
+        week_pos = position_of[f'week{week_num}']
+
+        # A user interacted if they were active themselves or one of their followers was. A follower
+        # rule hit requires the user to be active that week too, so it is implied by the first rule
+        # and the follower data never adds a user beyond the week's own set.
+        marked = set(repec_users)
+
+        # Positional writes into the week matrix instead of a repec_id scan per user
+        for repec_id in marked:
+            if repec_id in rows_of:
+                marks[rows_of[repec_id], week_pos] = 1
+
+    interacted_df[week_cols] = marks
     return interacted_df
 
-def run_mentions_interacted_algorithm(userinfo_df, repec_following_df, mastodon_user_week_df):
+def run_mentions_interacted_algorithm(userinfo_df, mastodon_user_week_df):
     """
     Execute the entire mentions and interacted algorithm workflow.
     """
     max_week = mastodon_user_week_df['week'].max()
     mentions_df = initialize_mentions_interacted_df(userinfo_df, max_week)
     interacted_df = initialize_mentions_interacted_df(userinfo_df, max_week)
-    following_dict = create_following_dict(repec_following_df)
+    mastodon_user_week_df = parse_repec_users(mastodon_user_week_df)
+
+    # Row positions per repec_id and the ordered week columns are computed once
+    rows_of = interacted_df.groupby('repec_id').indices
+    week_cols = [f'week{week_num}' for week_num in range(1, max_week + 1)]
 
     print("\n--- Running Mentions Algorithm ---")
     mentions_df = update_mentions_df(mentions_df, mastodon_user_week_df)
     
     print("\n--- Running Interacted Algorithm ---")
-    interacted_df = update_interacted_df(interacted_df, mastodon_user_week_df, following_dict)
+    interacted_df = update_interacted_df(interacted_df, mastodon_user_week_df, rows_of, week_cols)
     
     return mentions_df, interacted_df
 
@@ -112,7 +122,7 @@ def test_mentions_interacted():
     print(mastodon_user_week_df)
 
     print("\nRunning the mentions and interacted algorithms...")
-    mentions_df, interacted_df = run_mentions_interacted_algorithm(userinfo_df, repec_following_df, mastodon_user_week_df)
+    mentions_df, interacted_df = run_mentions_interacted_algorithm(userinfo_df, mastodon_user_week_df)
 
     print("\n--- Final Mentions DataFrame ---")
     print(mentions_df)